@@ -3,12 +3,14 @@ from discord.ext import commands
 from discord import app_commands
 import json
 import random
+import hashlib
 import asyncio
 import aiohttp
 import os
 import pymongo
 from dotenv import load_dotenv
 import time
+import math
 from functools import partial
 import threading
 from http.server import HTTPServer, BaseHTTPRequestHandler
@@ -20,6 +22,7 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 MONGO_URI = os.getenv("MONGO_URI")
 IMAGE_STORAGE_CHANNEL_ID = 1452547718248398931
 WAIT_TIME = 12
+MAX_CONCURRENT_GAMES = int(os.getenv("MAX_CONCURRENT_GAMES", "500"))
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
@@ -45,12 +48,14 @@ def keep_alive():
 DB_NAME = "DiscordBotDB"
 COLLECTION_USERS = "users"
 COLLECTION_QUESTIONS = "questions"
+COLLECTION_META = "bot_meta"
 
 try:
     mongo_client = pymongo.MongoClient(MONGO_URI)
     db = mongo_client[DB_NAME]
     users_col = db[COLLECTION_USERS]
     questions_col = db[COLLECTION_QUESTIONS]
+    meta_col = db[COLLECTION_META]
     print("Connected to MongoDB")
 except Exception as e:
     print(f"MongoDB Error: {e}")
@@ -151,11 +156,79 @@ async def process_image_url(url):
     
     return url
 
+DEV_GUILD_ID = os.getenv("DEV_GUILD_ID")
+COMMAND_SYNC_FILE = ".command_sync.json"
+
+def _command_payload(cmd):
+    try: return cmd.to_dict(bot.tree)
+    except TypeError: return cmd.to_dict()
+
+def command_schema_hash(guild=None):
+    payload = [_command_payload(cmd) for cmd in bot.tree.get_commands(guild=guild)]
+    payload.sort(key=lambda c: (c.get("type", 1), c["name"]))
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _get_sync_hash_sync(scope):
+    try:
+        doc = meta_col.find_one({"_id": f"command_sync:{scope}"})
+        if doc: return doc.get("hash")
+    except Exception as e:
+        print(f"Sync Hash Mongo Error: {e}")
+    if os.path.exists(COMMAND_SYNC_FILE):
+        try:
+            with open(COMMAND_SYNC_FILE, "r", encoding="utf-8") as f: return json.load(f).get(scope)
+        except: pass
+    return None
+
+def _set_sync_hash_sync(scope, digest):
+    try:
+        meta_col.update_one({"_id": f"command_sync:{scope}"}, {"$set": {"hash": digest}}, upsert=True)
+    except Exception as e:
+        print(f"Sync Hash Mongo Error: {e}")
+        data = {}
+        if os.path.exists(COMMAND_SYNC_FILE):
+            try:
+                with open(COMMAND_SYNC_FILE, "r", encoding="utf-8") as f: data = json.load(f)
+            except: pass
+        data[scope] = digest
+        with open(COMMAND_SYNC_FILE, "w", encoding="utf-8") as f: json.dump(data, f)
+
+async def sync_commands_if_changed():
+    try:
+        guild = discord.Object(id=int(DEV_GUILD_ID)) if DEV_GUILD_ID else None
+        if guild: bot.tree.copy_global_to(guild=guild)
+        digest = command_schema_hash(guild)
+    except Exception as e:
+        print(f"Command Sync Error: {e}")
+        return
+    scope = f"{bot.application_id}:{DEV_GUILD_ID or 'global'}"
+    try:
+        if await run_db_task(_get_sync_hash_sync, scope) == digest:
+            print("Slash commands unchanged, skip sync")
+            return
+    except Exception as e:
+        print(f"Sync Hash Error: {e}")
+    try:
+        await bot.tree.sync(guild=guild)
+    except Exception as e:
+        print(f"Command Sync Error: {e}")
+        return
+    try:
+        await run_db_task(_set_sync_hash_sync, scope, digest)
+    except Exception as e:
+        print(f"Sync Hash Error: {e}")
+    print(f"Synced slash commands ({DEV_GUILD_ID or 'global'})")
+
+@bot.event
+async def setup_hook():
+    round_scheduler.start()
+    await sync_commands_if_changed()
+
 @bot.event
 async def on_ready():
     print(f'Bot Online: {bot.user}')
     refresh_questions_cache()
-    await bot.tree.sync()
 
 @bot.tree.command(name="add_q", description="Thêm câu hỏi thủ công")
 async def add_q(interaction: discord.Interaction, question: str, answer: str, image_url: str = None):
@@ -267,30 +340,150 @@ async def view_qs(interaction: discord.Interaction):
     embed = discord.Embed(description=desc, color=discord.Color.blue())
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
-async def game_loop(channel):
-    channel_id = channel.id
-    active_games[channel_id] = {"active": True, "fails": 0, "history": []}
+SCHEDULER_TICK = 0.25
+SCHEDULER_SLOTS = 512
+SCHEDULER_MAX_IO = int(os.getenv("SCHEDULER_MAX_IO", "256"))
+CORRECT_PAUSE = 2
+ROUND_PAUSE = 3
+MAX_FAILS = 5
+
+class TimerWheel:
+    # Hashed timer wheel on the monotonic clock: O(1) schedule, one slot per tick
+    def __init__(self, tick=SCHEDULER_TICK, slots=SCHEDULER_SLOTS):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.origin = time.monotonic()
+        self.current = 0
+
+    def schedule(self, delay, item):
+        target = math.ceil((time.monotonic() - self.origin + delay) / self.tick)
+        target = max(target, self.current + 1)
+        self.slots[target % len(self.slots)].append((target, item))
+
+    def advance(self, now):
+        due = []
+        target = int((now - self.origin) / self.tick)
+        while self.current < target:
+            self.current += 1
+            pos = self.current % len(self.slots)
+            slot = self.slots[pos]
+            if not slot: continue
+            keep = []
+            for entry in slot:
+                (due if entry[0] <= self.current else keep).append(entry)
+            self.slots[pos] = keep
+        return [item for _, item in due]
+
+def pick_question(game):
+    total_qs = len(questions_cache)
+    history = game["history"]
+    limit_n = int(total_qs * 0.75)
     
-    while active_games.get(channel_id, {}).get("active"):
-        if not questions_cache:
-            await channel.send("DB Empty", silent=True)
-            break
-
-        total_qs = len(questions_cache)
-        history = active_games[channel_id]["history"]
-        limit_n = int(total_qs * 0.75)
-        
-        while len(history) > limit_n: history.pop(0)
-        available = [i for i in range(total_qs) if i not in history]
-        
-        if not available:
-            history.clear()
-            available = list(range(total_qs))
+    while len(history) > limit_n: history.pop(0)
+    available = [i for i in range(total_qs) if i not in history]
+    
+    if not available:
+        history.clear()
+        available = list(range(total_qs))
+
+    idx = random.choice(available)
+    history.append(idx)
+    return idx
+
+class RoundScheduler:
+    # ask -> collect -> resolve -> pause -> ask; timers carry (game, gen), bumping gen cancels them.
+    # State changes happen in the driver, each step's I/O runs as its own task under a semaphore.
+    def __init__(self, max_games=MAX_CONCURRENT_GAMES, max_io=SCHEDULER_MAX_IO):
+        self.max_games = max_games
+        self.max_io = max_io
+        self.wheel = TimerWheel()
+        self.io_slots = None
+        self.waiting = {}
+        self.tasks = []
+
+    def start(self):
+        if self.tasks: return
+        self.io_slots = asyncio.Semaphore(self.max_io)
+        self.tasks.append(bot.loop.create_task(self._drive()))
+
+    def start_game(self, channel, announce=False):
+        if len(active_games) >= self.max_games:
+            self.waiting[channel.id] = channel
+            return len(self.waiting)
+        game = {
+            "active": True, "fails": 0, "history": [], "announce": announce,
+            "channel": channel, "state": "ask", "gen": 0,
+        }
+        active_games[channel.id] = game
+        self._dispatch(game)
+        return None
+
+    def stop_game(self, channel_id):
+        if self.waiting.pop(channel_id, None): return True
+        game = active_games.get(channel_id)
+        if not game: return False
+        game["active"] = False
+        if game["state"] == "pause":
+            game["gen"] += 1
+            self._finish(game)
+        return True
 
-        idx = random.choice(available)
-        active_games[channel_id]["history"].append(idx)
-        q = questions_cache[idx]
-        
+    def _dispatch(self, game):
+        bot.loop.create_task(self._step(game, game["gen"]))
+
+    def _after(self, game, state, delay):
+        game["state"] = state
+        game["gen"] += 1
+        self.wheel.schedule(delay, (game, game["gen"]))
+
+    def _finish(self, game):
+        channel_id = game["channel"].id
+        if active_games.get(channel_id) is game:
+            del active_games[channel_id]
+        while self.waiting and len(active_games) < self.max_games:
+            channel_id = next(iter(self.waiting))
+            self.start_game(self.waiting.pop(channel_id), announce=True)
+
+    async def _drive(self):
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            for game, gen in self.wheel.advance(time.monotonic()):
+                if game["gen"] != gen: continue
+                if game["state"] == "collect": game["state"] = "resolve"
+                elif game["state"] == "pause": game["state"] = "ask"
+                self._dispatch(game)
+
+    async def _step(self, game, gen):
+        async with self.io_slots:
+            if game["gen"] != gen: return
+            try:
+                if game["state"] == "ask": await self._ask(game)
+                elif game["state"] == "resolve": await self._resolve(game)
+            except Exception as e:
+                print(f"Game Error ({game['channel'].id}): {e}")
+                self._finish(game)
+
+    def on_message(self, msg):
+        game = active_games.get(msg.channel.id)
+        if not game or game["state"] != "collect" or msg.author.bot: return None
+        if msg.content.lower().strip() == game["answer"]:
+            game["winner"] = msg.author
+            game["state"] = "resolve"
+            game["gen"] += 1
+            self._dispatch(game)
+            return True
+        return False
+
+    async def _ask(self, game):
+        channel = game["channel"]
+        if not game["active"] or not questions_cache:
+            if not questions_cache: await channel.send("DB Empty", silent=True)
+            return self._finish(game)
+        if game["announce"]:
+            game["announce"] = False
+            await channel.send("🎮 Started!")
+
+        q = questions_cache[pick_question(game)]
         visual_end_time = time.time() + WAIT_TIME
         
         embed = discord.Embed(title="TRIVIA", description=f"**{q['question']}**", color=0xD4AF37)
@@ -300,57 +493,48 @@ async def game_loop(channel):
         
         await channel.send(embed=embed, silent=True)
         
-        actual_end_time = time.time() + WAIT_TIME + 0.5
-        winner = None
-        
-        while time.time() < actual_end_time:
-            remaining = actual_end_time - time.time()
-            if remaining <= 0: break
-            try:
-                msg = await bot.wait_for(
-                    'message', 
-                    check=lambda m: m.channel.id == channel_id and not m.author.bot, 
-                    timeout=remaining
-                )
-                if msg.content.lower().strip() == str(q["answer"]).lower().strip():
-                    winner = msg.author
-                    break 
-                else:
-                    try: await msg.add_reaction("❌")
-                    except: pass
-            except asyncio.TimeoutError:
-                break
-        
+        game.update({"q": q, "answer": str(q["answer"]).lower().strip(), "winner": None})
+        self._after(game, "collect", WAIT_TIME + 0.5)
+
+    async def _resolve(self, game):
+        channel, winner = game["channel"], game["winner"]
+        pause = ROUND_PAUSE
         if winner:
             await run_db_task(_update_user_balance_sync, winner.id, balance_change=36)
             await channel.send(f"✅ Correct! <@{winner.id}> +$36", silent=True)
-            active_games[channel_id]["fails"] = 0
-            await asyncio.sleep(2)
+            game["fails"] = 0
+            pause += CORRECT_PAUSE
         else:
-            await channel.send(f"⏰ Time's up! A: **{q['answer']}**", silent=True)
-            active_games[channel_id]["fails"] += 1
+            await channel.send(f"⏰ Time's up! A: **{game['q']['answer']}**", silent=True)
+            game["fails"] += 1
 
-        if active_games[channel_id]["fails"] >= 5:
+        if game["fails"] >= MAX_FAILS:
             await channel.send("Game Over", silent=True)
-            active_games[channel_id]["active"] = False
-        
-        await asyncio.sleep(3)
+            game["active"] = False
+        self._after(game, "pause", pause)
+
+round_scheduler = RoundScheduler()
 
-    active_games.pop(channel_id, None)
+@bot.listen("on_message")
+async def collect_answers(msg):
+    if round_scheduler.on_message(msg) is False:
+        try: await msg.add_reaction("❌")
+        except: pass
 
 @bot.tree.command(name="startgp")
 async def startgp(interaction: discord.Interaction):
-    if interaction.channel_id in active_games:
+    if interaction.channel_id in active_games or interaction.channel_id in round_scheduler.waiting:
         return await interaction.response.send_message("Running!", ephemeral=True)
     if not questions_cache:
         return await interaction.response.send_message("DB Empty", ephemeral=True)
+    position = round_scheduler.start_game(interaction.channel)
+    if position:
+        return await interaction.response.send_message(f"⏳ Queued #{position}")
     await interaction.response.send_message("🎮 Started!")
-    bot.loop.create_task(game_loop(interaction.channel))
 
 @bot.tree.command(name="stopgp")
 async def stopgp(interaction: discord.Interaction):
-    if interaction.channel_id in active_games:
-        active_games[interaction.channel_id]["active"] = False
+    if round_scheduler.stop_game(interaction.channel_id):
         await interaction.response.send_message("Stopping...", ephemeral=True)
     else:
         await interaction.response.send_message("No game found", ephemeral=True)
@@ -3,14 +3,18 @@ from discord.ext import commands
 from discord import app_commands
 import json
 import random
+import hashlib
 import asyncio
 import aiohttp
 import os
 import pymongo
-from pymongo.errors import ConnectionFailure
+from pymongo import UpdateOne
+from pymongo.errors import ConnectionFailure, BulkWriteError
 from dotenv import load_dotenv
 import time
+import math
 from functools import partial
+from array import array
 import threading
 from http.server import HTTPServer, BaseHTTPRequestHandler
 
@@ -22,6 +26,8 @@ MONGO_URI = os.getenv("MONGO_URI")
 
 # Cấu hình thời gian trả lời câu hỏi (giây)
 WAIT_TIME = 20 
+# Số game chạy cùng lúc tối đa, các kênh sau sẽ xếp hàng
+MAX_CONCURRENT_GAMES = int(os.getenv("MAX_CONCURRENT_GAMES", "500"))
 
 # --- PHẦN FIX LỖI RENDER (QUAN TRỌNG) ---
 class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
@@ -46,12 +52,18 @@ def keep_alive():
 # --- DATABASE SETUP ---
 DB_NAME = "DiscordBotDB"
 COLLECTION_NAME = "users"
+COLLECTION_PRICE_HISTORY = "price_history"
+COLLECTION_QUESTION_STATS = "question_stats"
+COLLECTION_META = "bot_meta"
 
 try:
     mongo_client = pymongo.MongoClient(MONGO_URI)
     mongo_client.admin.command('ping')
     db = mongo_client[DB_NAME]
     users_col = db[COLLECTION_NAME]
+    price_history_col = db[COLLECTION_PRICE_HISTORY]
+    question_stats_col = db[COLLECTION_QUESTION_STATS]
+    meta_col = db[COLLECTION_META]
     print("✅ Connected to MongoDB!")
 except Exception as e:
     print(f"❌ MongoDB Error: {e}")
@@ -59,11 +71,18 @@ except Exception as e:
     pass
 
 # --- CACHE & CONFIG ---
-btc_cache = {
-    "price": 95000.0,
-    "last_updated": 0,
-    "ttl": 60 
+# Các cặp giá được theo dõi (mặc định chỉ BTCUSDT), vd: PRICE_SYMBOLS=BTCUSDT,ETHUSDT
+PRICE_SYMBOLS = [s.strip().upper() for s in os.getenv("PRICE_SYMBOLS", "BTCUSDT").split(",") if s.strip()]
+if "BTCUSDT" not in PRICE_SYMBOLS: PRICE_SYMBOLS.insert(0, "BTCUSDT")
+# Có thể trỏ tới websocket giả lập ở local để test offline, vd: ws://127.0.0.1:8765/stream
+PRICE_WS_URL = os.getenv("PRICE_WS_URL", "wss://stream.binance.com:9443/stream")
+
+# symbol -> {"price", "last_updated", "ttl", "source"}
+price_cache = {
+    symbol: {"price": 95000.0 if symbol == "BTCUSDT" else 0.0, "last_updated": 0, "ttl": 60, "source": None}
+    for symbol in PRICE_SYMBOLS
 }
+btc_cache = price_cache["BTCUSDT"]
 
 # --- ASYNC DB WRAPPER ---
 async def run_db_task(func, *args, **kwargs):
@@ -97,45 +116,681 @@ async def fetch_url(session, url):
             return await response.json()
     return None
 
-async def get_btc_price():
-    current_time = time.time()
-    if current_time - btc_cache["last_updated"] < btc_cache["ttl"]:
-        return btc_cache["price"]
+# --- LỊCH SỬ GIÁ (RING BUFFER + NẾN OHLC) ---
+PRICE_REFRESH_INTERVAL = 30      # giây giữa 2 lần kiểm tra / lấy giá dự phòng (REST)
+PRICE_STREAM_STALE = 15          # stream im lặng quá số giây này -> dùng REST
+PRICE_SNAPSHOT_INTERVAL = 300    # giây giữa 2 lần lưu lịch sử
+PRICE_SNAPSHOT_FILE = "price_history_{}.json"
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+class ArrayRing:
+    # Ring buffer dung lượng cố định, mỗi cột là một array('d') -> bộ nhớ không đổi.
+    # Cột 0 luôn là timestamp (tăng dần) để tìm kiếm nhị phân.
+    def __init__(self, capacity, columns):
+        self.capacity = capacity
+        self.cols = [array("d", bytes(8 * capacity)) for _ in range(columns)]
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _pos(self, i):
+        if i < 0: i += self.size
+        return (self.start + i) % self.capacity
+
+    def push(self, *values):
+        if self.size < self.capacity:
+            pos = self._pos(self.size)
+            self.size += 1
+        else:
+            # Đầy: ghi đè phần tử cũ nhất
+            pos = self.start
+            self.start = (self.start + 1) % self.capacity
+        for col, value in zip(self.cols, values):
+            col[pos] = value
+
+    def get(self, i, col=0):
+        return self.cols[col][self._pos(i)]
+
+    def set(self, i, col, value):
+        self.cols[col][self._pos(i)] = value
+
+    def find(self, ts):
+        # Vị trí phần tử cuối cùng có timestamp <= ts, -1 nếu không có
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.get(mid) <= ts: lo = mid + 1
+            else: hi = mid
+        return lo - 1
+
+    def rows(self):
+        return [[col[self._pos(i)] for col in self.cols] for i in range(self.size)]
 
-    price = None
-    async with aiohttp.ClientSession() as session:
+    def load_before(self, rows):
+        # Nạp dữ liệu cũ vào trước các dòng đang có (giá live có thể tới trước snapshot),
+        # bỏ các dòng không cũ hơn dòng đầu tiên để timestamp luôn tăng dần
+        current = self.rows()
+        if current: rows = [row for row in rows if row[0] < current[0][0]]
+        self.start = self.size = 0
+        for row in rows + current: self.push(*row)
+
+class OHLCSeries:
+    # Nến gộp sẵn theo chu kỳ `period` giây: (start, open, high, low, close)
+    T, O, H, L, C = range(5)
+
+    def __init__(self, period, capacity):
+        self.period = period
+        self.ring = ArrayRing(capacity, 5)
+
+    def __len__(self):
+        return len(self.ring)
+
+    def update(self, ts, price):
+        bucket = ts - ts % self.period
+        ring = self.ring
+        if len(ring) and ring.get(-1) == bucket:
+            if price > ring.get(-1, self.H): ring.set(-1, self.H, price)
+            if price < ring.get(-1, self.L): ring.set(-1, self.L, price)
+            ring.set(-1, self.C, price)
+        elif not len(ring) or ring.get(-1) < bucket:
+            ring.push(bucket, price, price, price, price)
+
+    def open_at(self, ts):
+        # Giá mở của nến chứa ts. Chỉ tin khi nến liền trước cũng có dữ liệu:
+        # nến đầu tiên / sau khoảng mất dữ liệu có giá mở nằm giữa nến, có thể xa ts
+        ring = self.ring
+        i = ring.find(ts)
+        if i < 1: return None
+        start = ring.get(i)
+        if ts - start >= self.period or ring.get(i - 1) != start - self.period: return None
+        return ring.get(i, self.O)
+
+    def closes_since(self, ts):
+        ring = self.ring
+        i = max(ring.find(ts), 0)
+        return [ring.get(j, self.C) for j in range(i, len(ring))]
+
+class PriceHistory:
+    def __init__(self, sample_interval=PRICE_REFRESH_INTERVAL):
+        self.sample_interval = sample_interval
+        self.raw = ArrayRing(86400 // sample_interval, 2)  # 24h mẫu thô
+        self.m1 = OHLCSeries(60, 1440)                     # 24h nến 1 phút
+        self.h1 = OHLCSeries(3600, 24 * 30)                # 30 ngày nến 1 giờ
+
+    def add(self, ts, price):
+        self.m1.update(ts, price)
+        self.h1.update(ts, price)
+        raw = self.raw
+        if not len(raw) or ts - raw.get(-1) >= self.sample_interval:
+            raw.push(ts, price)
+
+    def price_ago(self, seconds, now=None):
+        now = now or time.time()
+        target = now - seconds
+        # Dùng nguồn chi tiết nhất có mẫu đủ gần mốc thời gian, không có thì None ("—")
+        price = self._raw_near(target)
+        if price is None: price = self.m1.open_at(target)
+        if price is None: price = self.h1.open_at(target)
+        return price
+
+    def _raw_near(self, ts):
+        # Mẫu thô gần ts nhất (trước hoặc sau), lệch quá 1 chu kỳ lấy mẫu thì bỏ
+        raw = self.raw
+        i = raw.find(ts)
+        best = None
+        for j in (i, i + 1):
+            if 0 <= j < len(raw) and abs(raw.get(j) - ts) <= self.sample_interval:
+                if best is None or abs(raw.get(j) - ts) < abs(raw.get(best) - ts): best = j
+        return raw.get(best, 1) if best is not None else None
+
+    def change_pct(self, seconds, price, now=None):
+        old = self.price_ago(seconds, now)
+        if not old: return None
+        return (price - old) / old * 100
+
+    def sparkline(self, window=86400, width=24, now=None):
+        now = now or time.time()
+        series = self.m1 if window <= 86400 else self.h1
+        closes = series.closes_since(now - window)
+        if len(closes) < 2: return ""
+        if len(closes) > width:
+            step = len(closes) / width
+            closes = [closes[int(i * step)] for i in range(width - 1)] + [closes[-1]]
+        lo, hi = min(closes), max(closes)
+        span = (hi - lo) or 1
+        return "".join(SPARK_CHARS[int((c - lo) / span * (len(SPARK_CHARS) - 1))] for c in closes)
+
+    def to_snapshot(self):
+        return {"raw": self.raw.rows(), "m1": self.m1.ring.rows(), "h1": self.h1.ring.rows()}
+
+    def load_snapshot(self, snap):
+        self.raw.load_before(snap.get("raw", []))
+        self.m1.ring.load_before(snap.get("m1", []))
+        self.h1.ring.load_before(snap.get("h1", []))
+
+price_histories = {symbol: PriceHistory() for symbol in PRICE_SYMBOLS}
+btc_history = price_histories["BTCUSDT"]
+
+def record_price(symbol, price, source, ts=None):
+    ts = ts or time.time()
+    cache = price_cache[symbol]
+    cache["price"] = price
+    cache["last_updated"] = ts
+    cache["source"] = source
+    price_histories[symbol].add(ts, price)
+
+def _save_price_snapshot_sync(symbol, snapshot):
+    try:
+        price_history_col.replace_one({"_id": symbol}, {"_id": symbol, **snapshot}, upsert=True)
+    except Exception as e:
+        # Không có Mongo -> lưu ra đĩa
+        print(f"Snapshot Mongo Error: {e}")
+        with open(PRICE_SNAPSHOT_FILE.format(symbol), "w", encoding="utf-8") as f: json.dump(snapshot, f)
+
+def _load_price_snapshot_sync(symbol):
+    try:
+        doc = price_history_col.find_one({"_id": symbol})
+        if doc: return doc
+    except Exception as e:
+        print(f"Snapshot Mongo Error: {e}")
+    path = PRICE_SNAPSHOT_FILE.format(symbol)
+    if os.path.exists(path):
         try:
-            data = await fetch_url(session, "https://api.binance.com/api/v3/ticker/price?symbol=BTCUSDT")
-            if data: price = float(data["price"])
+            with open(path, "r", encoding="utf-8") as f: return json.load(f)
         except: pass
+    return None
+
+# --- PRICE FEED: STREAM CHÍNH + REST DỰ PHÒNG ---
+class PriceProvider:
+    # Nguồn giá REST: trả về float hoặc None nếu không hỗ trợ / lỗi
+    name = "base"
+
+    async def fetch(self, session, symbol):
+        return None
+
+class BinanceRestProvider(PriceProvider):
+    name = "Binance"
+
+    async def fetch(self, session, symbol):
+        data = await fetch_url(session, f"https://api.binance.com/api/v3/ticker/price?symbol={symbol}")
+        return float(data["price"]) if data else None
+
+class CoinGeckoRestProvider(PriceProvider):
+    name = "CoinGecko"
+    COIN_IDS = {"BTCUSDT": "bitcoin", "ETHUSDT": "ethereum", "BNBUSDT": "binancecoin", "SOLUSDT": "solana"}
+
+    async def fetch(self, session, symbol):
+        coin = self.COIN_IDS.get(symbol)
+        if not coin: return None
+        data = await fetch_url(session, f"https://api.coingecko.com/api/v3/simple/price?ids={coin}&vs_currencies=usd")
+        return float(data[coin]["usd"]) if data else None
 
-        if price is None:
+class BinanceStreamProvider:
+    # Giữ 1 kết nối websocket (combined stream miniTicker) cho mọi symbol, tự reconnect với backoff
+    name = "Binance WS"
+
+    def __init__(self, url=PRICE_WS_URL, max_backoff=60):
+        self.url = url
+        self.max_backoff = max_backoff
+        self.connected = False
+
+    def stream_url(self, symbols):
+        return f"{self.url}?streams=" + "/".join(f"{s.lower()}@miniTicker" for s in symbols)
+
+    @staticmethod
+    def parse(raw):
+        # {"stream": "btcusdt@miniTicker", "data": {"s": "BTCUSDT", "c": "95000.1", ...}}
+        payload = json.loads(raw)
+        data = payload.get("data", payload)
+        if "s" not in data or "c" not in data: return None
+        return data["s"].upper(), float(data["c"])
+
+    async def run(self, symbols, on_price):
+        backoff = 1
+        while True:
             try:
-                data = await fetch_url(session, "https://api.coingecko.com/api/v3/simple/price?ids=bitcoin&vs_currencies=usd")
-                if data: price = float(data["bitcoin"]["usd"])
-            except: pass
+                async with aiohttp.ClientSession() as session:
+                    async with session.ws_connect(self.stream_url(symbols), heartbeat=30) as ws:
+                        print(f"🔌 Price stream connected ({', '.join(symbols)})")
+                        self.connected = True
+                        backoff = 1
+                        async for msg in ws:
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                tick = self.parse(msg.data)
+                                if tick: on_price(tick[0], tick[1], self.name)
+                            elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Price Stream Error: {e}")
+            finally:
+                self.connected = False
+            # Backoff luỹ thừa + jitter để không dồn reconnect khi sàn gặp sự cố
+            await asyncio.sleep(backoff + random.random())
+            backoff = min(backoff * 2, self.max_backoff)
 
-    if price:
-        btc_cache["price"] = price
-        btc_cache["last_updated"] = current_time
-        return price
-    
-    return btc_cache["price"] 
+class PriceFeed:
+    def __init__(self, symbols, stream, fallbacks):
+        self.symbols = symbols
+        self.stream = stream
+        self.fallbacks = fallbacks
+        self.tasks = []
+
+    def start(self):
+        # Chỉ khởi động 1 lần
+        if self.tasks: return
+        self.tasks.append(bot.loop.create_task(self._run()))
+
+    def on_price(self, symbol, price, source):
+        if symbol in price_cache and price > 0:
+            record_price(symbol, price, source)
+
+    def latest(self, symbol):
+        return price_cache[symbol]["price"]
+
+    def is_fresh(self, symbol, max_age):
+        return time.time() - price_cache[symbol]["last_updated"] < max_age
+
+    async def poll(self, session, symbol):
+        for provider in self.fallbacks:
+            try:
+                price = await provider.fetch(session, symbol)
+            except Exception:
+                price = None
+            if price:
+                self.on_price(symbol, price, provider.name)
+                return price
+        return None
+
+    async def get_price(self, symbol="BTCUSDT"):
+        cache = price_cache[symbol]
+        if self.is_fresh(symbol, cache["ttl"]):
+            return cache["price"]
+        # Chỉ gọi REST khi stream lẫn vòng dự phòng đều chưa có giá mới
+        async with aiohttp.ClientSession() as session:
+            price = await self.poll(session, symbol)
+        return price or cache["price"]
+
+    async def _run(self):
+        # Nạp lịch sử xong mới mở stream / vòng dự phòng
+        for symbol in self.symbols:
+            try:
+                snap = await run_db_task(_load_price_snapshot_sync, symbol)
+            except Exception as e:
+                snap = None
+                print(f"Snapshot Load Error: {e}")
+            if snap:
+                price_histories[symbol].load_snapshot(snap)
+                print(f"📈 Loaded {len(price_histories[symbol].raw)} {symbol} price samples")
+        self.tasks.append(bot.loop.create_task(self._fallback_loop()))
+        await self.stream.run(self.symbols, self.on_price)
+
+    async def _fallback_loop(self):
+        last_snapshot = time.time()
+        while True:
+            try:
+                stale = [s for s in self.symbols if not self.is_fresh(s, PRICE_STREAM_STALE)]
+                if stale:
+                    async with aiohttp.ClientSession() as session:
+                        for symbol in stale: await self.poll(session, symbol)
+                if time.time() - last_snapshot >= PRICE_SNAPSHOT_INTERVAL:
+                    for symbol in self.symbols:
+                        await run_db_task(_save_price_snapshot_sync, symbol, price_histories[symbol].to_snapshot())
+                    last_snapshot = time.time()
+            except Exception as e:
+                print(f"Price Fallback Error: {e}")
+            await asyncio.sleep(PRICE_REFRESH_INTERVAL)
+
+price_feed = PriceFeed(PRICE_SYMBOLS, BinanceStreamProvider(), [BinanceRestProvider(), CoinGeckoRestProvider()])
+
+async def get_btc_price():
+    return await price_feed.get_price("BTCUSDT")
+
+def format_change(pct):
+    if pct is None: return "—"
+    return f"{'🟢' if pct >= 0 else '🔴'} {pct:+.2f}%"
+
+def build_btc_embed(price, user):
+    spark = btc_history.sparkline()
+    desc = f"Giá: **${price:,.2f}**"
+    if spark: desc += f"\n`{spark}` (24h)"
+    embed = discord.Embed(title="📊 SÀN BTC", description=desc, color=0xF7931A)
+    embed.add_field(name="Biến động", value=(
+        f"1h: {format_change(btc_history.change_pct(3600, price))}\n"
+        f"24h: {format_change(btc_history.change_pct(86400, price))}\n"
+        f"7d: {format_change(btc_history.change_pct(7 * 86400, price))}"
+    ))
+    embed.add_field(name="Ví bạn", value=f"💵 ${user['balance']:,.2f}\n🪙 {user['btc']:.6f} BTC")
+    return embed
+
+# --- QUESTION BANK (HOT RELOAD) ---
+QUESTIONS_FILE = "questions.json"
+# > 0: tự theo dõi file mỗi N giây và nạp lại khi có thay đổi (0 = tắt)
+QUESTIONS_WATCH_INTERVAL = int(os.getenv("QUESTIONS_WATCH_INTERVAL", "0"))
+questions_meta = {"mtime": None, "hash": None}
+questions_lock = asyncio.Lock()
+questions_watcher_task = None
+
+def _read_questions_sync(last_mtime=None, last_hash=None):
+    # Trả về (mtime, hash, data); data = None nếu nội dung không đổi
+    mtime = os.stat(QUESTIONS_FILE).st_mtime_ns
+    if mtime == last_mtime: return mtime, last_hash, None
+    with open(QUESTIONS_FILE, "rb") as f: raw = f.read()
+    digest = hashlib.sha1(raw).hexdigest()
+    if digest == last_hash: return mtime, digest, None
+    data = json.loads(raw)
+    if not isinstance(data, list): raise ValueError("questions.json phải là list")
+    for i, q in enumerate(data):
+        if not isinstance(q, dict) or not isinstance(q.get("question"), str) or not isinstance(q.get("answer"), str):
+            raise ValueError(f"Câu #{i + 1} phải có 'question' và 'answer' dạng chuỗi")
+    return mtime, digest, data
 
 def load_questions():
-    if not os.path.exists("questions.json"):
+    if not os.path.exists(QUESTIONS_FILE):
         # Mẫu json có ảnh
         sample = [
             {"question": "1 + 1 = ?", "answer": "2", "image_url": None},
             {"question": "Đây là con gì?", "answer": "Mèo", "image_url": "https://i.imgur.com/example_cat.jpg"}
         ]
-        with open("questions.json", "w", encoding="utf-8") as f: json.dump(sample, f)
-        return sample
+        with open(QUESTIONS_FILE, "w", encoding="utf-8") as f: json.dump(sample, f)
     try:
-        with open("questions.json", "r", encoding="utf-8") as f: return json.load(f)
+        questions_meta["mtime"], questions_meta["hash"], data = _read_questions_sync()
+        return data
     except: return []
 
+def question_key(q):
+    return (q.get("question"), q.get("image_url"))
+
+def diff_questions(old, new):
+    # Ghép câu cũ -> câu mới theo nội dung (câu hỏi + ảnh), không theo vị trí
+    new_slots = {}
+    for i, q in enumerate(new):
+        new_slots.setdefault(question_key(q), []).append(i)
+    remap, changed = {}, 0
+    for i, q in enumerate(old):
+        slots = new_slots.get(question_key(q))
+        if slots:
+            j = slots.pop(0)
+            remap[i] = j
+            if new[j] != q: changed += 1
+    return {
+        "remap": remap,
+        "added": len(new) - len(remap),
+        "removed": len(old) - len(remap),
+        "changed": changed,
+    }
+
+def swap_questions(new_bank, remap):
+    # Không có await ở đây -> các game không bao giờ thấy trạng thái nửa vời
+    global questions_bank
+    questions_bank = new_bank
+    added = question_stats.rebuild(new_bank)
+    for game in active_games.values():
+        game["history"] = [remap[i] for i in game["history"] if i in remap]
+    rebuild_sampler()
+    return added
+
+async def reload_questions():
+    # None nếu file không đổi, ngược lại trả về diff đã áp dụng
+    async with questions_lock:
+        mtime, digest, data = await run_db_task(_read_questions_sync, questions_meta["mtime"], questions_meta["hash"])
+        if data is None:
+            questions_meta["mtime"], questions_meta["hash"] = mtime, digest
+            return None
+        diff = diff_questions(questions_bank, data)
+        added = swap_questions(data, diff["remap"])
+        # Chỉ ghi nhận file đã nạp khi đã thay thành công, lỗi thì lần sau đọc lại
+        questions_meta["mtime"], questions_meta["hash"] = mtime, digest
+    # Câu mới / được thêm lại: lấy số liệu đã lưu (chưa nạp lúc khởi động thì stats_flusher sẽ nạp)
+    if added and question_stats.loaded:
+        try:
+            merge_question_stats(await run_db_task(_load_question_stats_sync, added))
+        except Exception as e:
+            print(f"Stats Load Error: {e}")
+    return diff
+
+async def watch_questions():
+    while True:
+        await asyncio.sleep(QUESTIONS_WATCH_INTERVAL)
+        try:
+            diff = await reload_questions()
+            if diff: print(f"📚 Questions reloaded: +{diff['added']} -{diff['removed']} ~{diff['changed']}")
+        except Exception as e:
+            print(f"Question Watch Error: {e}")
+
 questions_bank = load_questions()
+
+# --- THỐNG KÊ CÂU HỎI + CHỌN CÂU CÓ TRỌNG SỐ ---
+STATS_FLUSH_INTERVAL = 120   # giây giữa 2 lần ghi gộp thống kê vào Mongo
+STATS_TIME_SAMPLES = 15      # số lần trả lời gần nhất giữ lại để tính trung vị
+HISTORY_SIZE = 20            # số câu gần nhất không lặp lại trong 1 kênh
+
+def question_id(q):
+    return hashlib.sha1(json.dumps(question_key(q), ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class QuestionStats:
+    # Bộ đếm theo câu hỏi trong các array gọn, đánh chỉ số theo vị trí trong questions_bank
+    def __init__(self, bank):
+        self.ids = []
+        self.index = {}
+        # qid -> phần tăng chưa ghi: {"question", "shown", "solved", "wrong", "times"}
+        self.pending = {}
+        self.loaded = False
+        self.rebuild(bank)
+
+    def rebuild(self, bank):
+        # Giữ số liệu theo nội dung câu hỏi khi bộ câu hỏi đổi thứ tự / thêm bớt.
+        # Trả về id các câu mới xuất hiện (chưa có số liệu trong RAM).
+        n, k = len(bank), STATS_TIME_SAMPLES
+        shown, solved, wrong = (array("I", bytes(4 * n)) for _ in range(3))
+        n_times = array("I", bytes(4 * n))
+        times = array("f", bytes(4 * n * k))
+        ids = [question_id(q) for q in bank]
+        added = []
+        for i, qid in enumerate(ids):
+            j = self.index.get(qid)
+            if j is None:
+                added.append(qid)
+                continue
+            shown[i], solved[i], wrong[i] = self.shown[j], self.solved[j], self.wrong[j]
+            n_times[i] = self.n_times[j]
+            times[i * k:(i + 1) * k] = self.times[j * k:(j + 1) * k]
+        self.shown, self.solved, self.wrong = shown, solved, wrong
+        self.n_times, self.times = n_times, times
+        self.ids = ids
+        self.index = {qid: i for i, qid in enumerate(ids)}
+        return added
+
+    def _add_time(self, i, seconds):
+        k = STATS_TIME_SAMPLES
+        self.times[i * k + self.n_times[i] % k] = seconds
+        self.n_times[i] += 1
+
+    def record_round(self, i, answer_time, wrong_guesses):
+        # answer_time = None nếu không ai trả lời đúng
+        self.shown[i] += 1
+        self.wrong[i] += wrong_guesses
+        delta = self.pending.setdefault(self.ids[i], {
+            "question": questions_bank[i].get("question"), "shown": 0, "solved": 0, "wrong": 0, "times": [],
+        })
+        delta["shown"] += 1
+        delta["wrong"] += wrong_guesses
+        if answer_time is not None:
+            self.solved[i] += 1
+            self._add_time(i, answer_time)
+            delta["solved"] += 1
+            delta["times"] = (delta["times"] + [answer_time])[-STATS_TIME_SAMPLES:]
+
+    def median_time(self, i):
+        k = STATS_TIME_SAMPLES
+        c = min(self.n_times[i], k)
+        if not c: return None
+        vals = sorted(self.times[i * k:i * k + c])
+        mid = c // 2
+        return vals[mid] if c % 2 else (vals[mid - 1] + vals[mid]) / 2
+
+    def weight(self, i):
+        shown, solved = self.shown[i], self.solved[i]
+        # Tỉ lệ giải được (làm mượt Laplace): câu mới = 0.5, câu khó -> 0
+        solve_rate = (solved + 1) / (shown + 2)
+        w = 1 + 2 * (1 - solve_rate)
+        if shown and not solved: w += 1
+        # Trả lời càng chậm càng khó; chưa có dữ liệu thì tính mức trung bình
+        median = self.median_time(i)
+        w += min(median / WAIT_TIME, 1) if median is not None else 0.5
+        w += min(self.wrong[i] / (shown + 1), 4) * 0.25
+        return w
+
+    def merge(self, docs):
+        # Cộng dồn số liệu đã lưu vào số liệu đang có trong RAM
+        for doc in docs:
+            i = self.index.get(doc["_id"])
+            if i is None: continue
+            self.shown[i] += doc.get("shown", 0)
+            self.solved[i] += doc.get("solved", 0)
+            self.wrong[i] += doc.get("wrong", 0)
+            for t in doc.get("times", [])[-STATS_TIME_SAMPLES:]: self._add_time(i, t)
+
+    def take_pending(self):
+        # Ghi phần tăng ($inc / $push + $slice) thay vì giá trị tuyệt đối -> không đè số liệu đã lưu
+        pending, self.pending = self.pending, {}
+        ops = []
+        for qid, delta in pending.items():
+            update = {
+                "$set": {"question": delta["question"]},
+                "$inc": {"shown": delta["shown"], "solved": delta["solved"], "wrong": delta["wrong"]},
+            }
+            if delta["times"]:
+                update["$push"] = {"times": {"$each": delta["times"], "$slice": -STATS_TIME_SAMPLES}}
+            ops.append(UpdateOne({"_id": qid}, update, upsert=True))
+        return ops, pending
+
+    def restore_pending(self, pending):
+        # Ghi lỗi -> gộp lại phần tăng để lần sau ghi tiếp
+        for qid, delta in pending.items():
+            current = self.pending.get(qid)
+            if current is None:
+                self.pending[qid] = delta
+                continue
+            for key in ("shown", "solved", "wrong"): current[key] += delta[key]
+            current["times"] = (delta["times"] + current["times"])[-STATS_TIME_SAMPLES:]
+
+class FenwickSampler:
+    # Cây Fenwick trên trọng số: cập nhật 1 câu và rút ngẫu nhiên đều O(log N)
+    def __init__(self, weights):
+        n = self.n = len(weights)
+        self.w = array("d", weights)
+        self.tree = array("d", bytes(8 * (n + 1)))
+        for j in range(1, n + 1):
+            self.tree[j] += weights[j - 1]
+            parent = j + (j & -j)
+            if parent <= n: self.tree[parent] += self.tree[j]
+        self.top = 1 << (n.bit_length() - 1) if n else 0
+
+    def update(self, i, weight):
+        delta = weight - self.w[i]
+        if not delta: return
+        self.w[i] = weight
+        j = i + 1
+        while j <= self.n:
+            self.tree[j] += delta
+            j += j & -j
+
+    def total(self):
+        j, acc = self.n, 0.0
+        while j > 0:
+            acc += self.tree[j]
+            j -= j & -j
+        return acc
+
+    def find(self, r):
+        # Vị trí nhỏ nhất có tổng tiền tố > r
+        pos, step = 0, self.top
+        while step:
+            nxt = pos + step
+            if nxt <= self.n and self.tree[nxt] <= r:
+                pos = nxt
+                r -= self.tree[nxt]
+            step >>= 1
+        return min(pos, self.n - 1)
+
+    def sample(self, excluded=()):
+        # Rút trên cây dùng chung nhưng bỏ qua các câu `excluded` (lịch sử của 1 kênh):
+        # O(H log N) với H = số câu bị loại, không cần cây riêng cho từng kênh
+        excluded = sorted(set(excluded))
+        total = self.total() - sum(self.w[i] for i in excluded)
+        if total <= 1e-9: return None
+        r = random.random() * total
+        skipped, k = 0.0, 0
+        while True:
+            pos = self.find(r + skipped)
+            before = k
+            while k < len(excluded) and excluded[k] <= pos:
+                skipped += self.w[excluded[k]]
+                k += 1
+            if k == before: return pos
+
+question_stats = QuestionStats(questions_bank)
+question_sampler = None
+stats_task = None
+
+def rebuild_sampler():
+    # O(N), chỉ chạy khi nạp lại bộ câu hỏi / số liệu, không chạy khi bắt đầu game
+    global question_sampler
+    question_sampler = FenwickSampler([question_stats.weight(i) for i in range(len(questions_bank))])
+
+def pick_question(game):
+    # Ưu tiên câu chưa ai giải / khó, bỏ qua các câu vừa hỏi trong kênh
+    idx = question_sampler.sample(game["history"])
+    if idx is None:
+        game["history"] = []
+        idx = question_sampler.sample()
+    game["history"].append(idx)
+    if len(game["history"]) > HISTORY_SIZE: game["history"].pop(0)
+    return idx
+
+def refresh_question_weight(idx):
+    question_sampler.update(idx, question_stats.weight(idx))
+
+def merge_question_stats(docs):
+    question_stats.merge(docs)
+    rebuild_sampler()
+
+rebuild_sampler()
+
+def _load_question_stats_sync(ids=None):
+    query = {"_id": {"$in": ids}} if ids is not None else {}
+    return list(question_stats_col.find(query))
+
+def _flush_question_stats_sync(ops):
+    if ops: question_stats_col.bulk_write(ops, ordered=False)
+
+async def stats_flusher():
+    while True:
+        # Chưa nạp được số liệu cũ thì chưa ghi, tránh cộng trùng khi nạp sau
+        if not question_stats.loaded:
+            try:
+                merge_question_stats(await run_db_task(_load_question_stats_sync))
+                question_stats.loaded = True
+            except Exception as e:
+                print(f"Stats Load Error: {e}")
+        await asyncio.sleep(STATS_FLUSH_INTERVAL)
+        if not question_stats.loaded: continue
+        ops, pending = question_stats.take_pending()
+        try:
+            await run_db_task(_flush_question_stats_sync, ops)
+        except BulkWriteError as e:
+            # ordered=False: các lệnh khác đã $inc xong, chỉ ghi lại các lệnh lỗi
+            qids = list(pending)
+            failed = {qids[err["index"]] for err in e.details.get("writeErrors", [])}
+            question_stats.restore_pending({qid: pending[qid] for qid in failed})
+            print(f"Stats Flush Error: {len(failed)}/{len(ops)} failed")
+        except Exception as e:
+            question_stats.restore_pending(pending)
+            print(f"Stats Flush Error: {e}")
 active_games = {} 
 
 # --- VIEW: IMAGE GALLERY (MỚI) ---
@@ -188,6 +843,8 @@ class TransactionModal(discord.ui.Modal):
         await interaction.response.defer(ephemeral=True)
         user_id = str(interaction.user.id)
         user_data = await run_db_task(_get_user_data_sync, user_id)
+        # Khớp lệnh theo giá mới nhất từ stream, không dùng giá lúc mở form
+        self.price = await get_btc_price()
         try:
             amount = float(self.amount_input.value)
             if amount <= 0: raise ValueError
@@ -230,8 +887,7 @@ class CryptoView(discord.ui.View):
         await interaction.response.defer()
         self.current_price = await get_btc_price()
         user = await run_db_task(_get_user_data_sync, interaction.user.id)
-        embed = discord.Embed(title="📊 SÀN BTC", description=f"Giá: **${self.current_price:,.2f}**", color=0xF7931A)
-        embed.add_field(name="Ví bạn", value=f"💵 ${user['balance']:,.2f}\n🪙 {user['btc']:.6f} BTC")
+        embed = build_btc_embed(self.current_price, user)
         await interaction.edit_original_response(embed=embed, view=self)
 
 # --- BOT SETUP ---
@@ -239,110 +895,313 @@ intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix="!", intents=intents)
 
+# --- ĐỒNG BỘ SLASH COMMAND (CHỈ KHI THAY ĐỔI) ---
+# Đặt DEV_GUILD_ID để sync vào 1 server (cập nhật ngay) khi dev
+DEV_GUILD_ID = os.getenv("DEV_GUILD_ID")
+COMMAND_SYNC_FILE = ".command_sync.json"
+
+def _command_payload(cmd):
+    # discord.py >= 2.4 cần tree khi serialize command
+    try: return cmd.to_dict(bot.tree)
+    except TypeError: return cmd.to_dict()
+
+def command_schema_hash(guild=None):
+    payload = [_command_payload(cmd) for cmd in bot.tree.get_commands(guild=guild)]
+    payload.sort(key=lambda c: (c.get("type", 1), c["name"]))
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _get_sync_hash_sync(scope):
+    try:
+        doc = meta_col.find_one({"_id": f"command_sync:{scope}"})
+        if doc: return doc.get("hash")
+    except Exception as e:
+        print(f"Sync Hash Mongo Error: {e}")
+    if os.path.exists(COMMAND_SYNC_FILE):
+        try:
+            with open(COMMAND_SYNC_FILE, "r", encoding="utf-8") as f: return json.load(f).get(scope)
+        except: pass
+    return None
+
+def _set_sync_hash_sync(scope, digest):
+    try:
+        meta_col.update_one({"_id": f"command_sync:{scope}"}, {"$set": {"hash": digest}}, upsert=True)
+    except Exception as e:
+        # Không có Mongo -> lưu ra đĩa
+        print(f"Sync Hash Mongo Error: {e}")
+        data = {}
+        if os.path.exists(COMMAND_SYNC_FILE):
+            try:
+                with open(COMMAND_SYNC_FILE, "r", encoding="utf-8") as f: data = json.load(f)
+            except: pass
+        data[scope] = digest
+        with open(COMMAND_SYNC_FILE, "w", encoding="utf-8") as f: json.dump(data, f)
+
+async def sync_commands_if_changed():
+    # Lỗi ở đây chỉ ghi log: setup_hook ném lỗi sẽ làm bot.run dừng hẳn
+    try:
+        guild = discord.Object(id=int(DEV_GUILD_ID)) if DEV_GUILD_ID else None
+        if guild: bot.tree.copy_global_to(guild=guild)
+        digest = command_schema_hash(guild)
+    except Exception as e:
+        print(f"Command Sync Error: {e}")
+        return
+    scope = f"{bot.application_id}:{DEV_GUILD_ID or 'global'}"
+    try:
+        if await run_db_task(_get_sync_hash_sync, scope) == digest:
+            print("⏭️ Slash commands unchanged, skip sync")
+            return
+    except Exception as e:
+        print(f"Sync Hash Error: {e}")
+    try:
+        await bot.tree.sync(guild=guild)
+    except Exception as e:
+        # Không lưu hash -> lần khởi động sau sẽ sync lại
+        print(f"Command Sync Error: {e}")
+        return
+    try:
+        await run_db_task(_set_sync_hash_sync, scope, digest)
+    except Exception as e:
+        print(f"Sync Hash Error: {e}")
+    print(f"🔄 Synced slash commands ({DEV_GUILD_ID or 'global'})")
+
+@bot.event
+async def setup_hook():
+    # Chạy 1 lần khi khởi động (on_ready chạy lại mỗi lần reconnect/resume)
+    global questions_watcher_task, stats_task
+    price_feed.start()
+    if stats_task is None:
+        stats_task = bot.loop.create_task(stats_flusher())
+    round_scheduler.start()
+    if QUESTIONS_WATCH_INTERVAL > 0 and questions_watcher_task is None:
+        questions_watcher_task = bot.loop.create_task(watch_questions())
+    await sync_commands_if_changed()
+
 @bot.event
 async def on_ready():
     print(f'🤖 Bot Online: {bot.user}')
-    await bot.tree.sync()
 
-# --- GAME LOGIC (ĐÃ SỬA THỜI GIAN) ---
-async def game_loop(channel):
-    channel_id = channel.id
-    active_games[channel_id] = {"active": True, "fails": 0, "history": []}
-    
-    while active_games.get(channel_id, {}).get("active"):
-        if not questions_bank:
-            await channel.send("⚠️ Hết câu hỏi.")
-            break
-
-        recent = active_games[channel_id]["history"]
-        available = [i for i in range(len(questions_bank)) if i not in recent]
-        if not available:
-            recent.clear()
-            available = list(range(len(questions_bank)))
-            active_games[channel_id]["history"] = []
-
-        idx = random.choice(available)
-        active_games[channel_id]["history"].append(idx)
-        if len(active_games[channel_id]["history"]) > 20: active_games[channel_id]["history"].pop(0)
+# --- GAME LOGIC: 1 BỘ LẬP LỊCH CHUNG CHO MỌI KÊNH ---
+SCHEDULER_TICK = 0.25     # độ phân giải của timer wheel (giây)
+SCHEDULER_SLOTS = 512
+# Số bước game (gửi tin nhắn, cộng tiền...) được chạy I/O cùng lúc
+SCHEDULER_MAX_IO = int(os.getenv("SCHEDULER_MAX_IO", "256"))
+CORRECT_PAUSE = 2
+ROUND_PAUSE = 3
+MAX_FAILS = 5
+
+class TimerWheel:
+    # Hashed timer wheel theo đồng hồ monotonic: thêm hẹn giờ O(1), mỗi tick chỉ xét 1 ô
+    def __init__(self, tick=SCHEDULER_TICK, slots=SCHEDULER_SLOTS):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.origin = time.monotonic()
+        self.current = 0
+
+    def schedule(self, delay, item):
+        target = math.ceil((time.monotonic() - self.origin + delay) / self.tick)
+        target = max(target, self.current + 1)
+        self.slots[target % len(self.slots)].append((target, item))
+
+    def advance(self, now):
+        due = []
+        target = int((now - self.origin) / self.tick)
+        while self.current < target:
+            self.current += 1
+            pos = self.current % len(self.slots)
+            slot = self.slots[pos]
+            if not slot: continue
+            # Hẹn giờ xa hơn 1 vòng quay vẫn nằm lại trong ô
+            keep = []
+            for entry in slot:
+                (due if entry[0] <= self.current else keep).append(entry)
+            self.slots[pos] = keep
+        return [item for _, item in due]
+
+class RoundScheduler:
+    # Máy trạng thái mỗi game: ask -> collect -> resolve -> pause -> ask ...
+    # Timer chỉ mang (game, gen); đổi gen là huỷ mọi hẹn giờ cũ của game đó.
+    # Đổi trạng thái làm ngay trong driver; phần I/O của mỗi bước chạy thành task riêng,
+    # giới hạn bởi semaphore nên 1 kênh bị rate limit không chặn các kênh khác.
+    def __init__(self, max_games=MAX_CONCURRENT_GAMES, max_io=SCHEDULER_MAX_IO):
+        self.max_games = max_games
+        self.max_io = max_io
+        self.wheel = TimerWheel()
+        self.io_slots = None
+        self.waiting = {}   # channel_id -> channel, giữ thứ tự xếp hàng
+        self.tasks = []
+
+    def start(self):
+        # Chỉ khởi động 1 lần
+        if self.tasks: return
+        self.io_slots = asyncio.Semaphore(self.max_io)
+        self.tasks.append(bot.loop.create_task(self._drive()))
+
+    def start_game(self, channel, announce=False):
+        # Trả về None nếu bắt đầu ngay, hoặc vị trí trong hàng chờ
+        if len(active_games) >= self.max_games:
+            self.waiting[channel.id] = channel
+            return len(self.waiting)
+        game = {
+            "active": True, "fails": 0, "history": [], "announce": announce,
+            "channel": channel, "state": "ask", "gen": 0,
+        }
+        active_games[channel.id] = game
+        self._dispatch(game)
+        return None
+
+    def stop_game(self, channel_id):
+        if self.waiting.pop(channel_id, None): return True
+        game = active_games.get(channel_id)
+        if not game: return False
+        # Vòng đang hỏi vẫn chạy hết như cũ; game kết thúc ở bước kế tiếp
+        game["active"] = False
+        if game["state"] == "pause":
+            game["gen"] += 1
+            self._finish(game)
+        return True
+
+    def _dispatch(self, game):
+        bot.loop.create_task(self._step(game, game["gen"]))
+
+    def _after(self, game, state, delay):
+        game["state"] = state
+        game["gen"] += 1
+        self.wheel.schedule(delay, (game, game["gen"]))
+
+    def _finish(self, game):
+        channel_id = game["channel"].id
+        if active_games.get(channel_id) is game:
+            del active_games[channel_id]
+        while self.waiting and len(active_games) < self.max_games:
+            channel_id = next(iter(self.waiting))
+            self.start_game(self.waiting.pop(channel_id), announce=True)
+
+    async def _drive(self):
+        # 1 vòng lặp duy nhất cho mọi deadline -> tải timer không đổi theo số game
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            for game, gen in self.wheel.advance(time.monotonic()):
+                if game["gen"] != gen: continue
+                if game["state"] == "collect": game["state"] = "resolve"
+                elif game["state"] == "pause": game["state"] = "ask"
+                self._dispatch(game)
+
+    async def _step(self, game, gen):
+        # Semaphore đánh thức theo thứ tự chờ -> game tới hạn trước được chạy trước
+        async with self.io_slots:
+            if game["gen"] != gen: return
+            try:
+                if game["state"] == "ask": await self._ask(game)
+                elif game["state"] == "resolve": await self._resolve(game)
+            except Exception as e:
+                print(f"Game Error ({game['channel'].id}): {e}")
+                self._finish(game)
+
+    def on_message(self, msg):
+        game = active_games.get(msg.channel.id)
+        if not game or game["state"] != "collect" or msg.author.bot: return None
+        if msg.content.lower().strip() == game["answer"]:
+            game["winner"] = msg.author
+            game["state"] = "resolve"
+            game["gen"] += 1
+            self._dispatch(game)
+            return True
+        game["wrong"] += 1
+        return False
+
+    async def _ask(self, game):
+        if not game["active"] or not questions_bank:
+            if not questions_bank: await game["channel"].send("⚠️ Hết câu hỏi.")
+            return self._finish(game)
+        if game["announce"]:
+            # Kênh vừa được lấy ra từ hàng chờ
+            game["announce"] = False
+            await game["channel"].send("🎮 **Bắt đầu!**")
 
+        idx = pick_question(game)
+        # Lấy id trước khi await: /reload_qs có thể đổi bộ câu hỏi trong lúc gửi tin
+        qid = question_stats.ids[idx]
         q_data = questions_bank[idx]
-        correct_answer = q_data["answer"].lower().strip()
-        
-        # SỬ DỤNG BIẾN WAIT_TIME ĐỂ DỄ QUẢN LÝ
+        # Giờ hiển thị dùng đồng hồ thật, hạn chót thật dùng timer wheel (monotonic)
         end_time = time.time() + WAIT_TIME
-        
         embed = discord.Embed(title="🎯 TRIVIA!", description=f"**{q_data['question']}**", color=0xD4AF37)
         if q_data.get("image_url"): embed.set_image(url=q_data["image_url"])
-        
-        # Hiển thị thời gian đếm ngược đẹp hơn
         embed.add_field(name="Thời gian", value=f"⏳ <t:{int(end_time)}:R> ({WAIT_TIME}s)")
-        
-        await channel.send(embed=embed)
+        await game["channel"].send(embed=embed)
 
-        winner = None
-        
-        while time.time() < end_time:
-            remaining = end_time - time.time()
-            if remaining <= 0: break
+        game.update({
+            "q": q_data, "qid": qid, "answer": q_data["answer"].lower().strip(),
+            "asked_at": time.monotonic(), "winner": None, "wrong": 0,
+        })
+        self._after(game, "collect", WAIT_TIME)
 
-            try:
-                def check(m): return m.channel.id == channel_id and not m.author.bot
-                
-                msg = await bot.wait_for('message', check=check, timeout=remaining)
-                user_ans = msg.content.lower().strip()
-
-                if user_ans == correct_answer:
-                    winner = msg.author
-                    break 
-                else:
-                    try: await msg.add_reaction("❌")
-                    except: pass
-            
-            except asyncio.TimeoutError:
-                break
-        
+    async def _resolve(self, game):
+        channel, winner = game["channel"], game["winner"]
+        # Bộ câu hỏi có thể đã được nạp lại trong lúc chờ -> tìm lại vị trí theo nội dung
+        idx = question_stats.index.get(game["qid"])
+        if idx is not None:
+            question_stats.record_round(idx, time.monotonic() - game["asked_at"] if winner else None, game["wrong"])
+            refresh_question_weight(idx)
+
+        pause = ROUND_PAUSE
         if winner:
             bonus = 36
             await run_db_task(_update_user_balance_sync, winner.id, balance_change=bonus)
             await channel.send(f"✅ **Chính xác!** <@{winner.id}> +${bonus}.")
-            active_games[channel_id]["fails"] = 0
-            await asyncio.sleep(2)
+            game["fails"] = 0
+            pause += CORRECT_PAUSE
         else:
-            await channel.send(f"⏰ Hết giờ! Đáp án: **{q_data['answer']}**")
-            active_games[channel_id]["fails"] += 1
+            await channel.send(f"⏰ Hết giờ! Đáp án: **{game['q']['answer']}**")
+            game["fails"] += 1
 
-        if active_games[channel_id]["fails"] >= 5:
+        if game["fails"] >= MAX_FAILS:
             await channel.send("🛑 Game Over (5 câu sai liên tiếp).")
-            active_games[channel_id]["active"] = False
-        
-        await asyncio.sleep(3)
+            game["active"] = False
+        self._after(game, "pause", pause)
 
-    active_games.pop(channel_id, None)
+round_scheduler = RoundScheduler()
+
+@bot.listen("on_message")
+async def collect_answers(msg):
+    if round_scheduler.on_message(msg) is False:
+        try: await msg.add_reaction("❌")
+        except: pass
 
 # --- COMMANDS ---
 
 @bot.tree.command(name="startgp", description="Bắt đầu game")
 async def startgp(interaction: discord.Interaction):
-    if interaction.channel_id in active_games:
+    if interaction.channel_id in active_games or interaction.channel_id in round_scheduler.waiting:
         return await interaction.response.send_message("Game đang chạy!", ephemeral=True)
     if not questions_bank:
         return await interaction.response.send_message("File câu hỏi trống.", ephemeral=True)
+    position = round_scheduler.start_game(interaction.channel)
+    if position:
+        return await interaction.response.send_message(f"⏳ Đang đủ {round_scheduler.max_games} game, kênh này xếp hàng **#{position}**.")
     await interaction.response.send_message("🎮 **Bắt đầu!**")
-    bot.loop.create_task(game_loop(interaction.channel))
 
 @bot.tree.command(name="stopgp", description="Dừng game")
 async def stopgp(interaction: discord.Interaction):
-    if interaction.channel_id in active_games:
-        active_games[interaction.channel_id]["active"] = False
+    if round_scheduler.stop_game(interaction.channel_id):
         await interaction.response.send_message("🛑 Đang dừng game...", ephemeral=True)
     else:
         await interaction.response.send_message("Không có game nào.", ephemeral=True)
 
 @bot.tree.command(name="reload_qs", description="Tải lại bộ câu hỏi từ file")
 async def reload_qs(interaction: discord.Interaction):
-    global questions_bank
-    questions_bank = load_questions()
-    await interaction.response.send_message(f"✅ Đã tải lại! Hiện có **{len(questions_bank)}** câu hỏi.", ephemeral=True)
+    await interaction.response.defer(ephemeral=True)
+    try:
+        diff = await reload_questions()
+    except Exception as e:
+        # File lỗi -> giữ nguyên bộ câu hỏi đang chạy
+        return await interaction.followup.send(f"❌ Không đọc được file: {e}", ephemeral=True)
+    if diff is None:
+        return await interaction.followup.send(f"ℹ️ File không đổi. Hiện có **{len(questions_bank)}** câu hỏi.", ephemeral=True)
+    await interaction.followup.send(
+        f"✅ Đã tải lại! +{diff['added']} / -{diff['removed']} / ~{diff['changed']} → hiện có **{len(questions_bank)}** câu hỏi.",
+        ephemeral=True
+    )
 
 # LỆNH MỚI: GALLERY
 @bot.tree.command(name="gallery", description="Xem tất cả ảnh trong bộ câu hỏi")
@@ -363,9 +1222,8 @@ async def bitcoin_cmd(interaction: discord.Interaction):
     price = await get_btc_price()
     user = await run_db_task(_get_user_data_sync, interaction.user.id)
     view = CryptoView(current_price=price)
-    embed = discord.Embed(title="📊 SÀN BTC", description=f"Giá: **${price:,.2f}**", color=0xF7931A)
-    embed.add_field(name="Ví bạn", value=f"💵 ${user['balance']:,.2f}\n🪙 {user['btc']:.6f} BTC")
-    embed.set_footer(text="Nguồn: Binance / CoinGecko")
+    embed = build_btc_embed(price, user)
+    embed.set_footer(text=f"Nguồn: {btc_cache['source'] or 'Binance / CoinGecko'}")
     await interaction.followup.send(embed=embed, view=view)
 
 @bot.tree.command(name="rank", description="Bảng xếp hạng")